@@ -4,6 +4,51 @@ from UTILS.readers import LorenzoReader2
 import numpy as np
 from tempfile import NamedTemporaryFile
 from UTILS.readers import blocks
+from multiprocessing import Lock
+
+#guards writes to arrays made by make_shared_array, inherited by the workers when the pool forks
+_shared_lock = None
+
+def make_shared_array(shape):
+    """
+        Creates a zeroed float64 array in shared memory for workers to accumulate results into.
+
+        Must be called before fire_multiprocess so the workers inherit the lock used by add_to_shared_array.
+        Requires Python 3.8 or later.
+
+        Parameters:
+            shape (tuple): The shape of the array.
+
+        Returns:
+            shm (shared_memory.SharedMemory): The shared memory block.  Pass shm.name to the workers and call shm.unlink() when finished.
+            array (numpy.array): A view of the shared memory block.
+    """
+    #shared_memory needs Python 3.8+, so don't import it for every script that uses this module
+    from multiprocessing import shared_memory
+    global _shared_lock
+    if _shared_lock is None:
+        _shared_lock = Lock()
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*np.dtype(np.float64).itemsize)
+    array = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    array[:] = 0
+    return shm, array
+
+def add_to_shared_array(name, values):
+    """
+        Adds results from a worker into an array made by make_shared_array.
+
+        Parameters:
+            name (str): The name of the shared memory block.
+            values (list of numpy.array): One array for each entry along the first axis of the shared array.
+    """
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray((len(values), *values[0].shape), dtype=np.float64, buffer=shm.buf)
+    with _shared_lock:
+        for dst, src in zip(array, values):
+            dst += src
+    del array
+    shm.close()
 
 #actually unused these days, but just in case...
 def get_n_cpu():
@@ -29,6 +29,74 @@ def cal_confs(traj_file):
     with open(traj_file, "rb") as f:
         return (sum(bl.count(b"t") for bl in blocks(f)))
 
+#finds where each configuration starts, so readers can seek to it instead of reading everything before it
+def conf_offsets(traj_file):
+    """
+    Finds the byte offset of the start of every configuration in a trajectory
+
+    Parameters:
+        traj_file (str): The name of the trajectory file.
+
+    Returns:
+        offsets (numpy.array): The offset of each configuration's time line, as int64.
+    """
+    offsets = []
+    pos = 0
+    prev = ord("\n")
+    with open(traj_file, "rb") as f:
+        for bl in blocks(f):
+            chunk = np.frombuffer(bl, dtype=np.uint8)
+            starts = np.flatnonzero(chunk == ord("t"))
+            #a configuration starts at a "t" at the beginning of a line
+            before = np.where(starts > 0, chunk[starts-1], prev)
+            offsets.append(starts[before == ord("\n")] + pos)
+            prev = chunk[-1]
+            pos += len(bl)
+    if not offsets:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(offsets).astype(np.int64)
+
+#scanning the trajectory means reading the whole file, so remember the result next to it
+def cached_conf_offsets(traj_file):
+    """
+    Finds the byte offset of every configuration in a trajectory, reusing a previous scan if the file hasn't changed
+
+    The offsets are stored in <traj_file>.offsets.npy, preceded by the size and modification time of the trajectory.
+
+    Parameters:
+        traj_file (str): The name of the trajectory file.
+
+    Returns:
+        offsets (numpy.array): The offset of each configuration's time line, as int64.
+    """
+    st = os.stat(traj_file)
+    meta_file = traj_file + ".offsets.npy"
+    try:
+        cached = np.load(meta_file)
+        if cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2:]
+    except (OSError, ValueError, IndexError):
+        pass
+
+    offsets = conf_offsets(traj_file)
+    try:
+        np.save(meta_file, np.concatenate((np.array([st.st_size, st.st_mtime_ns], dtype=np.int64), offsets)))
+    except OSError:
+        pass #can't write next to the trajectory, just don't cache
+    return offsets
+
+def cached_cal_confs(traj_file):
+    """
+    Calculates the number of configurations in a trajectory, reusing the cache from cached_conf_offsets
+
+    Parameters:
+        traj_file (str): The name of the trajectory file.
+
+    Returns:
+        num_confs (int): The number of configurations in the trajectory.
+    """
+    return len(cached_conf_offsets(traj_file))
+
 #gets the value out of an oxDNA input file
 def get_input_parameter(input_file, parameter):
     fin = open(input_file)
@@ -165,4 +233,9 @@ class LorenzoReader2:
         for _ in range(N_skip):
             self._read(skip=True)
 
+        return self._read(only_strand_ends=only_strand_ends, skip=False)
+
+    # offset is the byte position of a configuration's time line, as found by conf_offsets()
+    def _get_system_at_offset(self, offset, only_strand_ends=False):
+        self._conf.seek(offset)
         return self._read(only_strand_ends=only_strand_ends, skip=False)
\ No newline at end of file
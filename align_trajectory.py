@@ -5,12 +5,11 @@
 # Date: 8/26/19
 # Takes a trajectory and aligns every frame to the first one and writes a new trajectory
 
-from Bio.SVDSuperimposer import SVDSuperimposer
 from sys import exit
 from UTILS.readers import LorenzoReader2
 import numpy as np
 import argparse
-from compute_mean import normalize
+from compute_mean import normalize, kabsch, compute_cms
 
 #helper function to retrieve positions
 fetch_np = lambda conf: np.array([
@@ -26,7 +25,7 @@ args = parser.parse_args()
 
 #run system checks
 from config import check_dependencies
-check_dependencies(["python", "numpy", "Bio"])
+check_dependencies(["python", "numpy"])
 
 #prepare the data files and calculate how many configurations there are to align
 top_file = args.topology[0]
@@ -38,7 +37,8 @@ r = LorenzoReader2(traj_file, top_file)
 ref = r._get_system()
 ref.inbox() #if you get something weird out of this, modify the reference particle ID for this function in base.py
 ref_conf = fetch_np(ref)
-sup = SVDSuperimposer()
+ref_center = compute_cms(ref_conf)
+ref_centered = ref_conf - ref_center
 
 #The topology remains the same so we only write the configuration
 ref.print_lorenzo_output(outfile, '/dev/null')
@@ -52,12 +52,10 @@ while mysystem != False:
     cur_conf = fetch_np(mysystem)
 
     #Superimpose the configuration to the reference
-    sup.set(ref_conf, cur_conf)
-    sup.run()
-    rot, tran = sup.get_rotran()
+    rot, tran = kabsch(ref_centered, ref_center, cur_conf)
 
     #Apply rotation and translation in one step
-    cur_conf = np.einsum('ij, ki -> kj', rot, cur_conf) + tran
+    cur_conf = cur_conf @ rot + tran
     
     #Overwrite positions and orientation
     for j,n in enumerate(mysystem._nucleotides):
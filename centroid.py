@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 
 from sys import stderr
-from Bio.SVDSuperimposer import SVDSuperimposer
 from json import loads, dumps
 from UTILS.readers import LorenzoReader2, cal_confs
 import numpy as np
 import argparse
 from UTILS import parallelize
 from json import load
+from compute_mean import kabsch, compute_cms
 
 def compute_centroid(reader, mean_structure, num_confs, start=None, stop=None):
     """
@@ -42,8 +42,9 @@ def compute_centroid(reader, mean_structure, num_confs, start=None, stop=None):
         n._a3 for n in conf._nucleotides
     ])
 
-    # Use the single-value decomposition method for superimposing configurations 
-    sup = SVDSuperimposer()
+    # the reference only needs to be centered once for kabsch()
+    mean_center = compute_cms(mean_structure)
+    mean_centered = mean_structure - mean_center
     lowest_rmsf = 100000 #if you have a larger number than this, we need to talk...
     centroid_candidate = np.zeros_like(mean_structure)
     centroid_a1 = np.zeros_like(mean_structure)
@@ -58,14 +59,12 @@ def compute_centroid(reader, mean_structure, num_confs, start=None, stop=None):
         indexed_cur_conf = indexed_fetch_np(mysystem)
         cur_conf_a1 = fetch_a1(mysystem)
         cur_conf_a3 = fetch_a3(mysystem)
-        sup.set(mean_structure, indexed_cur_conf)
-        sup.run()
-        rot, tran = sup.get_rotran()
-
-        cur_conf = np.einsum('ij, ki -> kj', rot, cur_conf) + tran
-        cur_conf_a1 = np.einsum('ij, ki -> kj', rot, cur_conf_a1)
-        cur_conf_a3 = np.einsum('ij, ki -> kj', rot, cur_conf_a3)
-        RMSF = sup.get_rms()
+        rot, tran = kabsch(mean_centered, mean_center, indexed_cur_conf)
+
+        cur_conf = cur_conf @ rot + tran
+        cur_conf_a1 = cur_conf_a1 @ rot
+        cur_conf_a3 = cur_conf_a3 @ rot
+        RMSF = np.sqrt(np.sum((indexed_cur_conf @ rot + tran - mean_structure)**2) / len(mean_structure))
         print("Frame number:",confid, "RMSF:", RMSF)
         if RMSF < lowest_rmsf:
             centroid_candidate = cur_conf
@@ -96,7 +95,7 @@ if __name__ == "__main__":
 
     #system check
     from config import check_dependencies
-    check_dependencies(["python", "Bio", "numpy"])
+    check_dependencies(["python", "numpy"])
 
     #-o names the output file
     if args.output:
@@ -115,7 +114,7 @@ if __name__ == "__main__":
 
     #handle the index file case
     indexed_fetch_np = lambda conf: np.array([
-        n.cm_pos for n in conf._nucleotides if n.index in indexes
+        n.cm_pos for n in conf._nucleotides if n.index in index_set
     ])
 
     #-i will make it only run on a subset of nucleotides.
@@ -132,6 +131,9 @@ if __name__ == "__main__":
         with open(top_file, 'r') as f:
             indexes = list(range(int(f.readline().split(' ')[0])))
 
+    #set lookup keeps the per-frame filter in indexed_fetch_np linear in the number of particles
+    index_set = frozenset(indexes)
+
     # load mean structure 
     mean_file = args.mean_structure[0]
     if mean_file.split(".")[-1] == "json":
@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 
 from sys import stderr
-from Bio.SVDSuperimposer import SVDSuperimposer
 from json import loads, dumps
-from UTILS.readers import LorenzoReader2, cal_confs
+from UTILS.readers import LorenzoReader2, cached_cal_confs
 import numpy as np
 import argparse
 from UTILS import parallelize
+from compute_mean import kabsch, compute_cms
 
 def compute_deviations(reader, mean_structure, num_confs, start=None, stop=None):
     """
@@ -35,8 +35,9 @@ def compute_deviations(reader, mean_structure, num_confs, start=None, stop=None)
         n.cm_pos for n in conf._nucleotides 
     ])
 
-    # Use the single-value decomposition method for superimposing configurations 
-    sup = SVDSuperimposer()
+    # the reference only needs to be centered once for kabsch()
+    mean_center = compute_cms(mean_structure)
+    mean_centered = mean_structure - mean_center
     deviations = []
 
     mysystem = reader._get_system(N_skip = start)
@@ -45,16 +46,15 @@ def compute_deviations(reader, mean_structure, num_confs, start=None, stop=None)
         mysystem.inbox()
         # calculate alignment transform
         cur_conf = fetch_np(mysystem)
-        sup.set(mean_structure, cur_conf)
-        sup.run()
-        print("Frame number:",confid, "RMSF:", sup.get_rms())
-        # realign frame
-        rot, tran = sup.get_rotran()
+        rot, tran = kabsch(mean_centered, mean_center, cur_conf)
         # align structures and collect coordinates for each frame 
         # compatible with json 
+        diff = cur_conf @ rot + tran - mean_structure
+        if verbose:
+            rms = np.sqrt(np.vdot(diff, diff) / len(mean_structure))
+            print("Frame number:",confid, "RMSF:", rms)
         deviations.append(
-           list(map(np.linalg.norm, 
-               np.array([np.dot(n_pos,rot) + tran for n_pos in cur_conf]) - mean_structure)) 
+           list(np.linalg.norm(diff, axis=1))
         )
         confid += 1
         mysystem = reader._get_system()
@@ -73,11 +73,12 @@ if __name__ == "__main__":
     parser.add_argument('topology', type=str, nargs=1, help='the topology file associted with the trajectory')
     parser.add_argument('-p', metavar='num_cpus', nargs=1, type=int, dest='parallel', help="(optional) How many cores to use")
     parser.add_argument('-o', '--output', metavar='output_file', nargs=1, help='The filename to save the deviations json file to')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Report the RMSF of the alignment of every frame')
     args = parser.parse_args()
 
     #system check
     from config import check_dependencies
-    check_dependencies(["python", "Bio", "numpy"])
+    check_dependencies(["python", "numpy"])
 
     #-o names the output file
     if args.output:
@@ -99,9 +100,10 @@ if __name__ == "__main__":
     top_file  = args.topology[0]
     traj_file = args.trajectory[0]
     parallel = args.parallel
+    verbose = args.verbose
     if parallel:
         n_cpus = args.parallel[0]
-    num_confs = cal_confs(traj_file)
+    num_confs = cached_cal_confs(traj_file)
 
     #Calculate deviations, in parallel if available
     if not parallel:
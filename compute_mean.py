@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
-from Bio.SVDSuperimposer import SVDSuperimposer
 import numpy as np
 from json import loads, dumps
 from sys import exit, stderr
-from UTILS.readers import LorenzoReader2, cal_confs
+from UTILS.readers import LorenzoReader2, cached_cal_confs, cached_conf_offsets
 from random import randint
 import argparse
 
+#without numba, rotated frames are summed in batches of up to this many
+ACCUMULATE_BATCH = 64
+#but keep each batch buffer to about 32 MB on large systems
+ACCUMULATE_BATCH_FLOATS = 4000000
+#with -v, the per-frame alignment info is written out this many frames at a time
+LOG_EVERY = 1000
+
 def pick_starting_configuration(traj_file, top_file, max_bound):
     """
         Pick a random conf out of the trajectory file to use as the reference structure.
@@ -28,7 +34,13 @@ def pick_starting_configuration(traj_file, top_file, max_bound):
         else:
             stop_at = randint(0, max_bound-1)
         print("INFO: We chose {} as reference".format(stop_at), file=stderr)
-        initial_structure = reader._get_system(N_skip=stop_at) #this is way faster than using next(), but doesn't automatically inbox the system
+        #seek straight to the configuration rather than reading through the ones before it
+        #this is also faster than using next(), but doesn't automatically inbox the system
+        offsets = cached_conf_offsets(traj_file)
+        if stop_at < len(offsets):
+            initial_structure = reader._get_system_at_offset(offsets[stop_at])
+        else:
+            initial_structure = False
         if not initial_structure:
             print("ERROR: Couldn't read structure at conf num {0}.  Something has gone weird".format(stop_at), file=stderr)
             exit(1)
@@ -47,10 +59,93 @@ def compute_cms(points):
         Returns: 
             The center of mass of the given points (numpy.array)
     """
-    cms = np.zeros(3)
-    for p in points:
-        cms += p
-    return cms / len(points)
+    return np.asarray(points).mean(axis=0)
+
+def kabsch(ref_centered, ref_center, conf):
+    """
+        Find the rigid transformation that best superimposes conf onto the reference configuration
+
+        Solves the 3x3 covariance problem directly.  The aligned configuration is conf @ rot + tran.
+        The covariance matrix is built as conf.T @ ref_centered, which is only correct if ref_centered really has its center of mass at the origin.
+        Callers must center the reference themselves (once, outside any frame loop); an uncentered reference silently gives the wrong rotation.
+
+        Parameters:
+            ref_centered (numpy.array): The reference positions shifted so that their center of mass is at the origin.  An Nx3 array.
+            ref_center (numpy.array): The center of mass of the reference configuration before it was shifted.
+            conf (numpy.array): The positions to align to the reference.  An Nx3 array.
+
+        Returns:
+            rot (numpy.array): The 3x3 rotation matrix.
+            tran (numpy.array): The translation vector.  conf @ rot + tran is the aligned configuration.
+    """
+    conf_center = conf.mean(axis=0)
+    H = conf.T @ ref_centered
+    u, _, vt = np.linalg.svd(H)
+    #don't allow a reflection
+    if np.linalg.det(u @ vt) < 0:
+        vt[2] = -vt[2]
+    rot = u @ vt
+    tran = ref_center - conf_center @ rot
+    return rot, tran
+
+def _rotate_accumulate(pos, a1, a3, rot, tran, mean_pos, mean_a1, mean_a3):
+    """
+        Rotate a configuration and add it to the running sums in a single pass over the particles
+
+        Compiled with numba when it is available, see rotate_accumulate.
+
+        Parameters:
+            pos (numpy.array): The position of each particle.  An Nx3 array.
+            a1 (numpy.array): The a1 orientation vector of each particle.  An Nx3 array.
+            a3 (numpy.array): The a3 orientation vector of each particle.  An Nx3 array.
+            rot (numpy.array): The 3x3 rotation matrix from kabsch().
+            tran (numpy.array): The translation vector from kabsch().
+            mean_pos (numpy.array): Running sum of positions, updated in place.
+            mean_a1 (numpy.array): Running sum of a1 vectors, updated in place.
+            mean_a3 (numpy.array): Running sum of a3 vectors, updated in place.
+    """
+    for i in range(pos.shape[0]):
+        for j in range(3):
+            p = tran[j]
+            x = 0.
+            z = 0.
+            for k in range(3):
+                p += pos[i, k] * rot[k, j]
+                x += a1[i, k] * rot[k, j]
+                z += a3[i, k] * rot[k, j]
+            mean_pos[i, j] += p
+            mean_a1[i, j] += x
+            mean_a3[i, j] += z
+
+#compiled in __main__ so that scripts importing kabsch() from here don't load numba
+rotate_accumulate = None
+
+def flush_batch(batches, storages, filled):
+    """
+        Add the frames collected in the batch buffers to the running sums
+
+        Parameters:
+            batches (tuple of numpy.array): Buffers of rotated frames.  Each is a BxNx3 array.
+            storages (tuple of numpy.array): The running sums matching each buffer, updated in place.
+            filled (int): The number of frames currently held in the buffers.
+    """
+    for batch, storage in zip(batches, storages):
+        storage += batch[:filled].sum(axis=0)
+
+def fill_arrays(system, pos, a1, a3):
+    """
+        Copy the positions and orientations of every nucleotide in a system into preallocated arrays
+
+        Parameters:
+            system (base.System): The oxDNA system to read from.
+            pos (numpy.array): Filled with the center of mass of each nucleotide.  An Nx3 array.
+            a1 (numpy.array): Filled with the a1 orientation vector of each nucleotide.  An Nx3 array.
+            a3 (numpy.array): Filled with the a3 orientation vector of each nucleotide.  An Nx3 array.
+    """
+    for i, n in enumerate(system._nucleotides):
+        pos[i] = n.cm_pos
+        a1[i] = n._a1
+        a3[i] = n._a3
 
 def normalize(v):
     """
@@ -67,7 +162,21 @@ def normalize(v):
        return v
     return v / norm
 
-def compute_mean (reader, align_conf, num_confs, start = None, stop = None):
+def normalize_rows(V):
+    """
+        Return a copy of V with every row normalized
+
+        Parameters:
+            V (numpy.array): An Nx3 array of vectors to be normalized.
+
+        Returns:
+            V / norm(V) (numpy.array), rows with zero norm are left unchanged.
+    """
+    norms = np.linalg.norm(V, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return V / norms
+
+def compute_mean (reader, align_conf_centered, num_confs, start = None, stop = None):
     """
         Computes the mean structure of a trajectory
 
@@ -75,7 +184,7 @@ def compute_mean (reader, align_conf, num_confs, start = None, stop = None):
 
         Parameters:
             reader (readers.LorenzoReader2): An active reader on the trajectory file to take the mean of.
-            align_conf (numpy.array): The position of each particle in the reference configuration.  A 3xN array.
+            align_conf_centered (numpy.array): The position of each particle in the reference configuration, centered at the origin.  A 3xN array.
             num_confs (int): The number of configurations in the reader.  
             <optional> start (int): The starting configuration ID to begin averaging at.  Used if parallel.
             <optional> stop (int): The configuration ID on which to end the averaging.  Used if parallel.
@@ -98,37 +207,67 @@ def compute_mean (reader, align_conf, num_confs, start = None, stop = None):
 
     # storage for the intermediate mean structures
     intermediate_mean_structures = []
-    # the class doing the alignment of 2 structures
-    sup = SVDSuperimposer()
-
-    mean_pos_storage = np.array([np.zeros(3) for _ in range(n_nuc)])
-    mean_a1_storage  = np.array([np.zeros(3) for _ in range(n_nuc)])
-    mean_a3_storage  = np.array([np.zeros(3) for _ in range(n_nuc)])
+    # the reference is centered at the origin in main
+    align_center = np.zeros(3)
+
+    mean_pos_storage = np.zeros((n_nuc, 3))
+    mean_a1_storage  = np.zeros((n_nuc, 3))
+    mean_a3_storage  = np.zeros((n_nuc, 3))
+
+    # buffers for the current configuration and its rotation, reused every frame
+    cur_conf_pos = np.empty((n_nuc, 3))
+    cur_conf_a1 = np.empty((n_nuc, 3))
+    cur_conf_a3 = np.empty((n_nuc, 3))
+    indexed_cur_conf_pos = np.empty_like(align_conf_centered)
+    aligned_diff = np.empty_like(align_conf_centered)
+
+    # without numba, rotated frames are collected and summed a batch at a time
+    if rotate_accumulate is None:
+        batch_size = max(1, min(ACCUMULATE_BATCH, ACCUMULATE_BATCH_FLOATS // (3 * n_nuc)))
+        batch_pos = np.empty((batch_size, n_nuc, 3))
+        batch_a1 = np.empty((batch_size, n_nuc, 3))
+        batch_a3 = np.empty((batch_size, n_nuc, 3))
+        batches = (batch_pos, batch_a1, batch_a3)
+        storages = (mean_pos_storage, mean_a1_storage, mean_a3_storage)
+        filled = 0
+
+    # per-frame alignment info, only collected with -v
+    log_lines = []
 
     # for every conf in the current trajectory we calculate the global mean
     confid = 0
 
     while mysystem != False and confid < stop:
         mysystem.inbox()
-        cur_conf_pos = fetch_np(mysystem)
-        indexed_cur_conf_pos = indexed_fetch_np(mysystem)
-        cur_conf_a1 =  fetch_a1(mysystem)
-        cur_conf_a3 =  fetch_a3(mysystem)
+        fill_arrays(mysystem, cur_conf_pos, cur_conf_a1, cur_conf_a3)
+        np.take(cur_conf_pos, index_mask, axis=0, out=indexed_cur_conf_pos, mode='clip')
 
         # calculate alignment
-        sup.set(align_conf, indexed_cur_conf_pos)
-        sup.run()
-        rot, tran = sup.get_rotran()
-
-        cur_conf_pos = np.einsum('ij, ki -> kj', rot, cur_conf_pos) + tran
-        cur_conf_a1 = np.einsum('ij, ki -> kj', rot, cur_conf_a1)
-        cur_conf_a3 = np.einsum('ij, ki -> kj', rot, cur_conf_a3)
-        mean_pos_storage += cur_conf_pos
-        mean_a1_storage += cur_conf_a1
-        mean_a3_storage += cur_conf_a3
-
-        # print the rmsd of the alignment in case anyone is interested...
-        print("Frame:", confid, "Time:", mysystem._time, "RMSF:", sup.get_rms())
+        rot, tran = kabsch(align_conf_centered, align_center, indexed_cur_conf_pos)
+
+        if rotate_accumulate is not None:
+            rotate_accumulate(cur_conf_pos, cur_conf_a1, cur_conf_a3, rot, tran, mean_pos_storage, mean_a1_storage, mean_a3_storage)
+        else:
+            # rotate with matmul so the product goes through BLAS rather than einsum's generic loop
+            np.matmul(cur_conf_pos, rot, out=batch_pos[filled])
+            batch_pos[filled] += tran
+            np.matmul(cur_conf_a1, rot, out=batch_a1[filled])
+            np.matmul(cur_conf_a3, rot, out=batch_a3[filled])
+            filled += 1
+            if filled == batch_size:
+                flush_batch(batches, storages, filled)
+                filled = 0
+
+        # report the rmsd of the alignment in case anyone is interested...
+        if verbose:
+            np.matmul(indexed_cur_conf_pos, rot, out=aligned_diff)
+            aligned_diff += tran
+            aligned_diff -= align_conf_centered
+            rms = np.sqrt(np.vdot(aligned_diff, aligned_diff) / len(align_conf_centered))
+            log_lines.append("Frame: {} Time: {} RMSF: {}\n".format(confid, mysystem._time, rms))
+            if len(log_lines) >= LOG_EVERY:
+                stderr.writelines(log_lines)
+                log_lines.clear()
         # thats all we do for a frame
         confid += 1
         mysystem = reader._get_system()
@@ -136,6 +275,9 @@ def compute_mean (reader, align_conf, num_confs, start = None, stop = None):
         # We produce 10 intermediate means to check decorrelation.
         # This can't be done neatly in parallel
         if not parallel and confid % INTERMEDIATE_EVERY == 0:
+            if rotate_accumulate is None:
+                flush_batch(batches, storages, filled)
+                filled = 0
             mp = np.copy(mean_pos_storage)
             mp /= confid
             intermediate_mean_structures.append(
@@ -143,8 +285,32 @@ def compute_mean (reader, align_conf, num_confs, start = None, stop = None):
             )
             print("INFO: Calculated intermediate mean for {} ".format(confid))
 
+    if rotate_accumulate is None:
+        flush_batch(batches, storages, filled)
+    stderr.writelines(log_lines)
+
     return(mean_pos_storage, mean_a1_storage, mean_a3_storage, intermediate_mean_structures, confid)
 
+def compute_mean_shared(reader, align_conf_centered, storage_name, num_confs, start = None, stop = None):
+    """
+        Runs compute_mean and adds the sums into shared memory so they don't need to be sent back to the parent process.
+
+        Parameters:
+            reader (readers.LorenzoReader2): An active reader on the trajectory file to take the mean of.
+            align_conf_centered (numpy.array): The position of each particle in the reference configuration, centered at the origin.  A 3xN array.
+            storage_name (str): The name of a (3, n_nuc, 3) array made by parallelize.make_shared_array.
+            num_confs (int): The number of configurations in the reader.
+            <optional> start (int): The starting configuration ID to begin averaging at.
+            <optional> stop (int): The configuration ID on which to end the averaging.
+
+        Returns:
+            intermediate_mean_structures (list): mean structures computed periodically during the summing to check decoorrelation.
+            confid (int): the number of configurations summed.
+    """
+    mean_pos_storage, mean_a1_storage, mean_a3_storage, intermediate_mean_structures, confid = compute_mean(reader, align_conf_centered, num_confs, start, stop)
+    parallelize.add_to_shared_array(storage_name, (mean_pos_storage, mean_a1_storage, mean_a3_storage))
+    return(intermediate_mean_structures, confid)
+
 
 
 if __name__ == "__main__":
@@ -157,15 +323,24 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--deviations', metavar='deviation_file', nargs=1, help='Immediatley run compute_deviations.py from the output')
     parser.add_argument('-i', metavar='index_file', dest='index_file', nargs=1, help='Compute mean structure of a subset of particles from a space-separated list in the provided file')
     parser.add_argument('-a', '--align', metavar='alignment_configuration', nargs=1, help='The id of the configuration to align to, otherwise random')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Report the RMSF of the alignment of every frame')
     args = parser.parse_args()
 
     from config import check_dependencies
-    check_dependencies(["python", "Bio", "numpy"])
+    check_dependencies(["python", "numpy"])
 
     #get file names
     top_file  = args.topology[0]
     traj_file = args.trajectory[0]
     parallel = args.parallel
+    verbose = args.verbose
+
+    #numba is optional, without it compute_mean falls back to numpy matmuls
+    try:
+        from numba import njit
+        rotate_accumulate = njit(cache=True, fastmath=True)(_rotate_accumulate)
+    except ImportError:
+        pass
     if parallel:
         from UTILS import parallelize
         n_cpus = args.parallel[0]
@@ -221,28 +396,12 @@ if __name__ == "__main__":
             indexes = list(range(int(f.readline().split(' ')[0])))
     
 
-    # helpers to fetch nucleotide positions and orientations
-    indexed_fetch_np = lambda conf: np.array([
-        n.cm_pos for n in conf._nucleotides if n.index in indexes
-    ])
-
-    fetch_np = lambda conf: np.array([
-        n.cm_pos for n in conf._nucleotides
-    ])
-
-    fetch_a1 = lambda conf: np.array([
-        n._a1 for n in conf._nucleotides
-    ])
-
-    fetch_a3 = lambda conf: np.array([
-        n._a3 for n in conf._nucleotides
-    ])
+    # the particles used for alignment, in the order they appear in the configuration
+    index_mask = np.array(sorted(set(indexes)), dtype=np.intp)
 
     # helper to prepare a configuration of np.array coordinates
     # into smth json is able to serialize
-    prep_pos_for_json = lambda conf: list(
-                            list(p) for p in conf
-                        )
+    prep_pos_for_json = lambda conf: np.asarray(conf).tolist()
 
 
     # The refference configuration which is used to define alignment
@@ -250,7 +409,7 @@ if __name__ == "__main__":
     align_conf = []
 
     #calculate the number of configurations in the trajectory 
-    num_confs = cal_confs(traj_file)
+    num_confs = cached_cal_confs(traj_file)
 
     #This also computes the mean every num_confs/10 configurations to check decorrelation.
     #Only works when run in serial.
@@ -262,29 +421,35 @@ if __name__ == "__main__":
         align_conf_id, align_conf = pick_starting_configuration(traj_file, top_file, num_confs)
         n_nuc = align_conf._N
         # we are just interested in the nucleotide positions
-        align_conf = indexed_fetch_np(align_conf)
+        align_conf = np.array([n.cm_pos for n in align_conf._nucleotides])[index_mask]
         # calculate the cms of the init structure
         cms = compute_cms(align_conf)
         # now shift the structure to 0,0,0 for simplicity
-        align_conf -= cms
+        align_conf_centered = align_conf - cms
 
     #Actually compute mean structure
     if not parallel:
         print("INFO: Computing mean of {} configurations using 1 core.".format(num_confs), file=stderr)
         r = LorenzoReader2(traj_file,top_file)
-        mean_pos_storage, mean_a1_storage, mean_a3_storage, intermediate_mean_structures, processed_frames = compute_mean(r, align_conf, num_confs)
+        mean_pos_storage, mean_a1_storage, mean_a3_storage, intermediate_mean_structures, processed_frames = compute_mean(r, align_conf_centered, num_confs)
 
     #If parallel, the trajectory is split into a number of chunks equal to the number of CPUs available.
     #Each of those chunks is then calculated seperatley and the result is summed.
     if parallel:
         print("INFO: Computing mean of {} configurations using {} cores.".format(num_confs, n_cpus), file=stderr)
-        out = parallelize.fire_multiprocess(traj_file, top_file, compute_mean, num_confs, n_cpus, align_conf)
-        mean_pos_storage = np.sum(np.array([i[0] for i in out]), axis=0)
-        mean_a1_storage = np.sum(np.array([i[1] for i in out]), axis=0)
-        mean_a3_storage = np.sum(np.array([i[2] for i in out]), axis=0)
+        #the workers add their sums straight into shared memory rather than returning them
+        storage_shm, storage = parallelize.make_shared_array((3, n_nuc, 3))
+        try:
+            out = parallelize.fire_multiprocess(traj_file, top_file, compute_mean_shared, num_confs, n_cpus, align_conf_centered, storage_shm.name)
+            mean_pos_storage, mean_a1_storage, mean_a3_storage = np.copy(storage)
+        finally:
+            #release the block even if a worker failed
+            del storage
+            storage_shm.close()
+            storage_shm.unlink()
         intermediate_mean_structures = []
-        [intermediate_mean_structures.extend(i[3]) for i in out]
-        processed_frames = sum((i[4] for i in out))
+        [intermediate_mean_structures.extend(i[0]) for i in out]
+        processed_frames = sum((i[1] for i in out))
     # finished task entry
     print("INFO: processed frames total: {}".format(processed_frames), file=stderr)
 
@@ -295,14 +460,14 @@ if __name__ == "__main__":
                     mean_pos_storage / processed_frames
                 ),
                 "a1_mean" : prep_pos_for_json(
-                   [normalize(v)  for v in (mean_a1_storage / processed_frames)]
+                   normalize_rows(mean_a1_storage / processed_frames)
                 ),
                 "a3_mean" : prep_pos_for_json(
-                   [normalize(v)  for v in (mean_a3_storage / processed_frames)]
+                   normalize_rows(mean_a3_storage / processed_frames)
                 ),
                 "p_frames" : processed_frames,
                 "ini_conf":{
-                    "conf": prep_pos_for_json(align_conf),
+                    "conf": prep_pos_for_json(align_conf_centered),
                     "id"  : align_conf_id
                 }
             })
@@ -338,6 +503,8 @@ if __name__ == "__main__":
         launchargs = [executable, path[0]+"/compute_deviations.py", jsonfile, traj_file, top_file, "-o {}".format(dev_file)]
         if parallel:
             launchargs.append("-p {}".format(n_cpus))
+        if verbose:
+            launchargs.append("-v")
         
         subprocess.run(launchargs)
 
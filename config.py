@@ -19,21 +19,18 @@ def check_dependencies(to_check):
 	dependencies = {
 		"numpy": 1.14,
 		"matplotlib": 3.0,
-		"Bio": 1.73,
 		"sklearn": 0.21,
 		"pathos": 0.2,
 	}
 	real_names = {
 		"numpy": "Numpy",
 		"matplotlib": "MatPlotLib",
-		"Bio": "BioPython",
 		"sklearn": "SciKit-Learn",
 		"pathos": "Pathos"
 	}
 	websites = {
 		"numpy": "numpy.org", 
 		"matplotlib": "matplotlib.org",
-		"Bio": "biopython.org",
 		"sklearn": "scikit-learn.org",
 		"pathos": "pypi.org/project/pathos/"
 	}
@@ -70,6 +67,6 @@ def check_dependencies(to_check):
 	return flag
 
 if __name__ == "__main__":
-	check_dependencies(["python", "numpy", "matplotlib", "Bio", "sklearn", "pathos"])
+	check_dependencies(["python", "numpy", "matplotlib", "sklearn", "pathos"])
 	p = set_analysis_path()
 	print("INFO: DNAnalysis found at:", p, file=stderr)
@@ -6,7 +6,7 @@ from sys import exit, stderr
 import subprocess
 import argparse
 import matplotlib.pyplot as plt
-from UTILS.readers import get_input_parameter
+from UTILS.readers import get_input_parameter, cached_cal_confs
 
 #Calculates distance taking PBC into account
 def min_image(p1, p2, box):
@@ -91,8 +91,11 @@ if __name__ == "__main__":
     for i,trajectory in enumerate(trajectories):
         with open(topology_files[i], 'r') as top:
             n_particles = int(top.readline().split(' ')[0])
+        #fill the distances straight into an array rather than growing lists
+        num_confs = cached_cal_confs(trajectory)
+        distances[i] = np.empty((len(p1s[i]), num_confs))
+        conf_id = 0
         with open(trajectory, 'r') as traj:
-            distances[i] = [[] for _ in p1s[i]]
             l = traj.readline()
             l = traj.readline() #skip the first time line
 
@@ -112,8 +115,9 @@ if __name__ == "__main__":
                     for j, (p1, p2) in enumerate(zip(p1s[i], p2s[i])):
                         p1 = d[p1]
                         p2 = d[p2]
-                        distances[i][j].append(min_image(p1, p2, box)*0.85)
+                        distances[i][j, conf_id] = min_image(p1, p2, box)*0.85
                         line_num = 0
+                    conf_id += 1
                 l = traj.readline() #returns false if there's no more conf to load
                 line_num += 1
             
@@ -121,7 +125,9 @@ if __name__ == "__main__":
             for j, (p1, p2) in enumerate(zip(p1s[i], p2s[i])):
                 p1 = d[p1]
                 p2 = d[p2]
-                distances[i][j].append(min_image(p1, p2, box)*0.85) #1 oxDNA su = 0.85 nm
+                distances[i][j, conf_id] = min_image(p1, p2, box)*0.85 #1 oxDNA su = 0.85 nm
+            conf_id += 1
+        distances[i] = distances[i][:, :conf_id]
     
     
     
@@ -139,10 +145,6 @@ if __name__ == "__main__":
                         f.write('{:.2f}\t'.format(value))
                 f.write('\n')
 
-    #convert the distance list into numpy arrays because they're easier to work with
-    for i, l in enumerate(distances):
-        distances[i] = np.array(l)
-    
     means = [np.mean(i, axis=1) for i in distances]
     medians = [np.median(i, axis=1) for i in distances]
     stdevs = [np.std(i, axis=1) for i in distances]
@@ -168,17 +170,11 @@ if __name__ == "__main__":
     [print("{}\t".format(t), end='') for t in names[:n_dists]]
     print("")
 
-    print("mean:\t", end='')
-    [print("{:.2f}\t".format(m), end='') for m in [i for sl in means for i in sl]]
-    print("")
+    print("mean:\t" + "".join("{:.2f}\t".format(m) for m in np.concatenate(means)))
 
-    print("stdev:\t", end='')
-    [print("{:.2f}\t".format(s), end='') for s in [i for sl in stdevs for i in sl]]
-    print("")
+    print("stdev:\t" + "".join("{:.2f}\t".format(s) for s in np.concatenate(stdevs)))
 
-    print("median:\t", end='')
-    [print("{:.2f}\t".format(m), end='') for m in [i for sl in medians for i in sl]]
-    print("")
+    print("median:\t" + "".join("{:.2f}\t".format(m) for m in np.concatenate(medians)))
 
     #make a histogram
     if hist == True:
@@ -157,7 +157,10 @@ if __name__ == "__main__":
     if parallel:
         print("INFO: Computing interparticle distances of {} configurations using {} cores.".format(num_confs, n_cpus), file=stderr)
         out = parallelize.fire_multiprocess(traj_file, top_file, get_mean, num_confs, n_cpus)
-        cartesian_distances = np.sum(np.array([i for i in out]), axis=0)
+        #sum in place rather than stacking every worker's NxN matrix into one array first
+        cartesian_distances = out[0]
+        for i in out[1:]:
+            cartesian_distances += i
 
     mean_distance_map = cartesian_distances * (1/(num_confs))
 
@@ -228,7 +231,9 @@ if __name__ == "__main__":
     if parallel:
         print("INFO: Computing distance deviations of {} configurations using {} cores.".format(num_confs, n_cpus), file=stderr)
         out = parallelize.fire_multiprocess(traj_file, top_file, get_devs, num_confs, n_cpus, masked_mean)
-        devs = np.sum(np.array([i for i in out]), axis=0)
+        devs = out[0]
+        for i in out[1:]:
+            devs += i
 
     #Dump the deviations to an oxView overlay file
     devs = np.ma.masked_array(devs, ~(devs != 0.0)) #mask all the 0s so they don't contribute to the mean
@@ -11,12 +11,11 @@ from UTILS.readers import LorenzoReader2, cal_confs, get_input_parameter
 from sys import exit, stderr
 import argparse
 from json import load, dumps
-from Bio.SVDSuperimposer import SVDSuperimposer
 from random import randint
 from UTILS import parallelize
 from warnings import catch_warnings, simplefilter
 from os import environ
-from compute_mean import compute_cms
+from compute_mean import compute_cms, kabsch
 from config import check_dependencies
 
 fetch_np = lambda conf: np.array([
@@ -67,7 +66,8 @@ def get_pca(reader, align_conf, num_confs, start=None, stop=None):
     mysystem = reader._get_system(N_skip = start)
     
     deviations_matrix = np.empty((stop, (len(align_conf))*3))
-    sup = SVDSuperimposer()
+    #the reference is centered at the origin in main
+    align_center = np.zeros(3)
     confid = 0
 
     #for every configuration in the trajectory chunk, align it to the mean and compute positional difference for every particle
@@ -75,11 +75,9 @@ def get_pca(reader, align_conf, num_confs, start=None, stop=None):
         print("-->", mysystem._time)
         mysystem.inbox()
         cur_conf = fetch_np(mysystem)
-        sup.set(align_conf, cur_conf)
-        sup.run()
-        rot, tran = sup.get_rotran()
+        rot, tran = kabsch(align_conf, align_center, cur_conf)
         #equivalent to taking the dot product of the rotation array and every vector in the deviations array
-        cur_conf = np.einsum('ij, ki -> kj', rot, cur_conf) + tran
+        cur_conf = cur_conf @ rot + tran
         deviations_matrix[confid] = (cur_conf-align_conf).flatten()
 
         confid += 1
@@ -97,7 +95,7 @@ if __name__ == "__main__":
     parser.add_argument('-c', metavar='cluster', dest='cluster', action='store_const', const=True, default=False, help="Run the clusterer on each configuration's position in PCA space?")
     args = parser.parse_args()
 
-    check_dependencies(["python", "numpy", "Bio"])
+    check_dependencies(["python", "numpy"])
 
     traj_file = args.trajectory[0]
     inputfile = args.inputfile[0] 
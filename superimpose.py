@@ -3,14 +3,13 @@
 #superimpose.py
 #Created by: Erik Poppleton
 #Date: 2/27/19
-#Takes two (or more) configurations and aligns all proceeding ones to the first using the svd superimposer, then spits them out as new dat files.
+#Takes two (or more) configurations and aligns all proceeding ones to the first using the Kabsch algorithm, then spits them out as new dat files.
 
-from Bio.SVDSuperimposer import SVDSuperimposer
 from sys import exit, stderr
 from UTILS.readers import LorenzoReader2
 import numpy as np
 import argparse
-from compute_mean import normalize
+from compute_mean import normalize, kabsch, compute_cms
 
 fetch_np = lambda conf: np.array([
     n.cm_pos for n in conf._nucleotides 
@@ -31,20 +30,18 @@ to_sup = []
 r = LorenzoReader2(ref_dat, top_file)
 ref = r._get_system()
 ref_conf = fetch_np(ref)
+ref_center = compute_cms(ref_conf)
+ref_centered = ref_conf - ref_center
 for i in args.victims:
     r = LorenzoReader2(i, top_file)
     sys = r._get_system()
     to_sup.append(sys)
 
-sup = SVDSuperimposer()
-
-#Run the biopython superimposer on each configuration and rewrite its configuration file
+#Superimpose each configuration and rewrite its configuration file
 for i, sys in enumerate(to_sup):
     cur_conf = fetch_np(sys)
-    sup.set(ref_conf, cur_conf)
-    sup.run()
-    rot, tran = sup.get_rotran()
-    cur_conf = np.einsum('ij, ki -> kj', rot, cur_conf) + tran
+    rot, tran = kabsch(ref_centered, ref_center, cur_conf)
+    cur_conf = cur_conf @ rot + tran
     for j,n in enumerate(sys._nucleotides):
         n.cm_pos = cur_conf[j]
         n._a1 = normalize(np.dot(n._a1, rot))